@@ -1,9 +1,13 @@
+import math
 import re
 import unicodedata
 from dataclasses import dataclass
-from typing import List, Optional, Tuple
+from functools import lru_cache
+from typing import Callable, Dict, FrozenSet, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
+from joblib import Parallel, delayed, effective_n_jobs
 from rapidfuzz import fuzz, process
 
 
@@ -13,38 +17,249 @@ LEGAL_FORMS = {
     "BV", "GMBH", "SPA", "SRL"
 }
 
+_LEGAL_RE = re.compile(r"\b(" + "|".join(sorted(LEGAL_FORMS)) + r")\b")
+_RE_NONALNUM = re.compile(r"[^A-Z0-9]+")
+_RE_WS = re.compile(r"\s+")
+_RE_COMBINING = re.compile("[\u0300-\u036f]")
+
+# table octet -> octet : A-Z et 0-9 conservés, tout le reste devient un espace
+_ALNUM = b"ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+_XLATE = bytes(c if c in _ALNUM else 0x20 for c in range(256))
+
 
 def normalize_name(name: str) -> str:
     """Normalisation robuste pour matching."""
     if not isinstance(name, str):
         return ""
+    return _normalize_name(name)
+
+
+@lru_cache(maxsize=1_000_000)
+def _normalize_name(name: str) -> str:
     x = name.upper()
-    x = unicodedata.normalize("NFKD", x)
-    x = "".join(c for c in x if not unicodedata.combining(c))
-    x = re.sub(r"[^A-Z0-9]", " ", x)
-    x = re.sub(r"\s+", " ", x).strip()
+    if not x.isascii():
+        # accents -> caractères combinants supprimés ; le reste du non-ASCII (’, –, Œ...)
+        # devient '?' puis un séparateur via _XLATE
+        x = _RE_COMBINING.sub("", unicodedata.normalize("NFKD", x))
+    x = x.encode("ascii", "replace").translate(_XLATE).decode("ascii")
     tokens = [t for t in x.split() if t not in LEGAL_FORMS]
     return " ".join(tokens)
 
 
-def is_plausible_match(query: str, candidate: str) -> bool:
+def normalize_series(s: pd.Series) -> pd.Series:
+    """Équivalent vectorisé de normalize_name, appliqué à toute une colonne."""
+    s = s.astype(object)
+    # valeurs non textuelles (nombres, NA) -> NA, rendues "" par le fillna final
+    s = s.where(s.map(lambda v: isinstance(v, str)))
+    return (
+        s.str.upper()
+         .str.normalize("NFKD")
+         .str.replace(_RE_COMBINING, "", regex=True)
+         .str.replace(_RE_NONALNUM, " ", regex=True)
+         .str.replace(_LEGAL_RE, "", regex=True)
+         .str.replace(_RE_WS, " ", regex=True)
+         .str.strip()
+         .fillna("")
+    )
+
+
+@lru_cache(maxsize=1_000_000)
+def _name_tokens(name: str) -> FrozenSet[str]:
+    return frozenset(name.split())
+
+
+def is_plausible_match(
+    query: str,
+    candidate: str,
+    q_tokens: Optional[FrozenSet[str]] = None,
+    c_tokens: Optional[FrozenSet[str]] = None
+) -> bool:
     """
     Garde-fou simple contre faux positifs :
     - au moins 2 caractères
     - au moins 1 token en commun si > 1 token
+    Les ensembles de tokens peuvent être passés s'ils sont déjà calculés.
     """
     if len(query) < 2 or len(candidate) < 2:
         return False
 
-    q_tokens = set(query.split())
-    c_tokens = set(candidate.split())
+    if q_tokens is None:
+        q_tokens = _name_tokens(query)
+    if c_tokens is None:
+        c_tokens = _name_tokens(candidate)
 
     if len(q_tokens) >= 2 and len(c_tokens) >= 2:
-        return len(q_tokens.intersection(c_tokens)) >= 1
+        return not q_tokens.isdisjoint(c_tokens)
 
     return True
 
 
+def _token_set_length(tokens: FrozenSet[str]) -> int:
+    """Longueur de la chaîne des tokens uniques joints par des espaces."""
+    return sum(len(t) for t in tokens) + max(len(tokens) - 1, 0)
+
+
+def _length_band(length: int, score_cutoff: float) -> Tuple[float, float]:
+    """
+    Longueurs de choix pouvant atteindre score_cutoff face à une requête de cette longueur
+    lorsqu'aucun token n'est commun. token_set_ratio vaut alors le ratio Indel des chaînes
+    de tokens triés, borné par 200 * min(l1, l2) / (l1 + l2).
+    """
+    if score_cutoff <= 0:
+        return 0, float("inf")
+    return (
+        math.floor(length * score_cutoff / (200 - score_cutoff)),
+        math.ceil(length * (200 - score_cutoff) / score_cutoff)
+    )
+
+
+@dataclass
+class _ChoiceIndex:
+    """
+    Index des choix côté droite pour la génération de candidats :
+    - noms ASCII concaténés dans un tampon d'octets, délimités par names_offsets
+    - tokens internés en entiers, index inversé token -> choix au format CSR (indptr, indices)
+    - choix triés par longueur (tous, et ceux d'un seul token) pour les bandes de longueur
+    Uniquement des tableaux NumPy : joblib écrit chacun une seule fois par appel et les
+    processus loky les ouvrent en memmap, au lieu de recevoir l'index picklé à chaque tâche.
+    """
+    names_buf: np.ndarray
+    names_offsets: np.ndarray
+    indptr: np.ndarray
+    indices: np.ndarray
+    by_len: np.ndarray
+    sorted_len: np.ndarray
+    single_by_len: np.ndarray
+    single_sorted_len: np.ndarray
+
+    def names(self) -> np.ndarray:
+        """Noms des choix (tableau d'objets str), reconstruits depuis le tampon d'octets."""
+        text = self.names_buf.tobytes().decode("ascii")
+        offsets = self.names_offsets.tolist()
+        names = np.empty(len(offsets) - 1, dtype=object)
+        names[:] = [text[a:b] for a, b in zip(offsets[:-1], offsets[1:])]
+        return names
+
+    def candidates(self, q_token_ids: Tuple[int, ...], n_tokens: int, lo: float, hi: float) -> np.ndarray:
+        """Indices triés des choix partageant un token, ou plausibles et dans la bande [lo, hi]."""
+        if n_tokens >= 2:
+            by_len, sorted_len = self.single_by_len, self.single_sorted_len
+        else:
+            by_len, sorted_len = self.by_len, self.sorted_len
+        parts = [by_len[np.searchsorted(sorted_len, lo, "left"):np.searchsorted(sorted_len, hi, "right")]]
+        for k in q_token_ids:
+            parts.append(self.indices[self.indptr[k]:self.indptr[k + 1]])
+        # union triée : sort + masque des doublons, nettement plus rapide que np.unique ici
+        ids = np.sort(np.concatenate(parts))
+        if len(ids) > 1:
+            ids = ids[np.concatenate(([True], ids[1:] != ids[:-1]))]
+        return ids
+
+
+def _build_choice_index(choices: List[str]) -> Tuple[_ChoiceIndex, Dict[str, int]]:
+    """Construit l'index des choix ; retourne aussi le dictionnaire token -> id (côté parent)."""
+    token_ids: Dict[str, int] = {}
+    pair_token: List[int] = []
+    pair_choice: List[int] = []
+    lengths = np.empty(len(choices), dtype=np.int32)
+    single = np.empty(len(choices), dtype=bool)
+
+    for j, c in enumerate(choices):
+        c_tokens = frozenset(c.split())
+        for t in c_tokens:
+            pair_token.append(token_ids.setdefault(t, len(token_ids)))
+            pair_choice.append(j)
+        lengths[j] = _token_set_length(c_tokens)
+        single[j] = len(c_tokens) < 2
+
+    # tri stable par token : les choix restent croissants dans chaque ligne CSR
+    tokens_arr = np.asarray(pair_token, dtype=np.int32)
+    indices = np.asarray(pair_choice, dtype=np.int32)[np.argsort(tokens_arr, kind="stable")]
+    indptr = np.zeros(len(token_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(tokens_arr, minlength=len(token_ids)), out=indptr[1:])
+
+    by_len = np.argsort(lengths, kind="stable").astype(np.int32)
+    single_by_len = by_len[single[by_len]]
+
+    names_offsets = np.zeros(len(choices) + 1, dtype=np.int64)
+    np.cumsum([len(c) for c in choices], out=names_offsets[1:])
+
+    index = _ChoiceIndex(
+        names_buf=np.frombuffer("".join(choices).encode("ascii"), dtype=np.uint8),
+        names_offsets=names_offsets,
+        indptr=indptr,
+        indices=indices,
+        by_len=by_len,
+        sorted_len=lengths[by_len],
+        single_by_len=single_by_len,
+        single_sorted_len=lengths[single_by_len]
+    )
+    return index, token_ids
+
+
+def _match_chunk(
+    queries: List[str],
+    query_token_ids: List[Tuple[int, ...]],
+    index: _ChoiceIndex,
+    score_cutoff: int,
+    refine_scorer: Optional[Callable[..., float]] = None,
+    top_k: int = 10
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Matching d'un lot de requêtes normalisées (exécuté dans un processus de travail).
+    query_token_ids : ids des tokens de chaque requête présents côté droite.
+    Retourne l'indice du choix retenu (-1 si aucun) et le score (NaN si aucun) par requête.
+    """
+    # une reconstruction des noms par lot, donc par processus et par appel : O(nombre de choix)
+    choices = index.names()
+    match_idx = np.full(len(queries), -1, dtype=np.int64)
+    match_score = np.full(len(queries), np.nan, dtype=np.float32)
+
+    for i, (q, q_token_ids) in enumerate(zip(queries, query_token_ids)):
+        if len(q) < 2:
+            continue
+
+        # candidats : choix partageant un token (token_set_ratio sans borne de longueur)
+        # + choix sans token commun mais plausibles et de longueur compatible avec le seuil
+        q_tokens = _name_tokens(q)
+        lo, hi = _length_band(_token_set_length(q_tokens), score_cutoff)
+        cand_ids = index.candidates(q_token_ids, len(q_tokens), lo, hi)
+        if not len(cand_ids):
+            continue
+
+        # noms normalisés en ASCII pur : stockés sur 1 octet par caractère par CPython, RapidFuzz
+        # les lit sans conversion ; les passer en bytes ne change rien au temps de calcul
+        names = choices[cand_ids]
+        if refine_scorer is None:
+            # extractOne relève son seuil au fil des choix (plus rapide qu'un cdist d'une ligne) ;
+            # à score égal il garde le premier, donc le plus petit indice
+            best = process.extractOne(q, names, scorer=fuzz.token_set_ratio, score_cutoff=score_cutoff)
+        else:
+            # 2e passe : le scorer de départage n'est appliqué qu'aux top_k candidats token_set_ratio
+            top = process.extract(q, names, scorer=fuzz.token_set_ratio, score_cutoff=score_cutoff, limit=top_k)
+            best = max(
+                ((name, refine_scorer(q, name), k) for name, _, k in top),
+                key=lambda r: (r[1], -r[2]),
+                default=None
+            )
+            if best is not None and best[1] < score_cutoff:
+                best = None
+
+        if best is None:
+            continue
+
+        _, score, k = best
+        best_j = int(cand_ids[k])
+        candidate = choices[best_j]
+        if not is_plausible_match(q, candidate, q_tokens, _name_tokens(candidate)):
+            continue
+
+        match_idx[i] = best_j
+        match_score[i] = score
+
+    return match_idx, match_score
+
+
 @dataclass
 class MatchResult:
     query_name: str
@@ -52,66 +267,84 @@ class MatchResult:
     score: Optional[float]
 
 
+def _normalize_distinct(s: pd.Series) -> np.ndarray:
+    """normalize_series appliqué aux seules valeurs distinctes de s, redistribué par position."""
+    codes, uniques = pd.factorize(s, use_na_sentinel=False)
+    return normalize_series(pd.Series(uniques, dtype=object)).to_numpy()[codes]
+
+
 def match_companies(
     df_left: pd.DataFrame,
     left_col: str,
     df_right: pd.DataFrame,
     right_col: str,
-    score_cutoff: int = 90
+    score_cutoff: int = 90,
+    n_jobs: int = -1,
+    refine_scorer: Optional[Callable[..., float]] = None,
+    top_k: int = 10
 ) -> pd.DataFrame:
     """
     Match de noms entre df_left[left_col] et df_right[right_col] via RapidFuzz.
     Retourne df_left + colonnes match.
+    n_jobs : nombre de processus pour le matching (-1 = tous les cœurs).
+    refine_scorer : scorer RapidFuzz optionnel (ex: fuzz.WRatio) pour départager les top_k
+    meilleurs candidats token_set_ratio ; match_score est alors son score (top_k >= 1).
     """
-    left = df_left.copy()
-    right = df_right.copy()
+    if top_k < 1:
+        raise ValueError(f"top_k doit être >= 1 (reçu {top_k})")
 
-    left["_norm"] = left[left_col].apply(normalize_name)
-    right["_norm"] = right[right_col].apply(normalize_name)
+    # pas de copie des DataFrames : seules les colonnes normalisées sont construites
+    left_norm = _normalize_distinct(df_left[left_col])
+    right_norm = _normalize_distinct(df_right[right_col])
 
-    # Liste des choix (côté droite)
-    choices = right["_norm"].dropna().unique().tolist()
+    # Liste des choix (côté droite, ordre de première apparition) et ligne de leur première
+    # occurrence ; un nom de moins de 2 caractères n'est jamais plausible
+    codes, uniques = pd.factorize(right_norm)
+    first_rows = np.unique(codes, return_index=True)[1]
+    keep = np.array([len(c) >= 2 for c in uniques], dtype=bool)
+    choices = uniques[keep].tolist()
+    choice_rows = first_rows[keep]
+    queries = left_norm.tolist()
 
-    results: List[Tuple[Optional[str], Optional[float]]] = []
+    # Index de blocage : token -> choix qui le contiennent, et choix triés par longueur.
+    # Deux noms d'au moins 2 tokens sans token commun sont rejetés par is_plausible_match ;
+    # sans token commun, le score est de plus borné par l'écart de longueur (_length_band).
+    # Le dictionnaire des tokens reste dans le processus parent : les requêtes y sont
+    # traduites en ids avant l'envoi aux workers.
+    index, token_ids = _build_choice_index(choices)
+    query_token_ids = [
+        tuple(token_ids[t] for t in _name_tokens(q) if t in token_ids)
+        for q in queries
+    ]
 
-    for q in left["_norm"].tolist():
-        if not q:
-            results.append((None, None))
-            continue
+    # requêtes découpées en un lot par cœur, traités en parallèle (processus loky).
+    # Chaque lot n'emporte que ses requêtes : les tableaux de l'index sont écrits une fois
+    # par appel par joblib et ouverts en memmap, puis chaque lot reconstruit les noms des
+    # choix en mémoire (une copie par processus de travail, de la taille des noms côté droite).
+    n_chunks = max(1, min(effective_n_jobs(n_jobs), len(queries)))
+    chunk_size = max(1, -(-len(queries) // n_chunks))
+    bounds = range(0, len(queries), chunk_size)
 
-        best = process.extractOne(
-            q,
-            choices,
-            scorer=fuzz.token_set_ratio,
-            score_cutoff=score_cutoff
+    chunk_results = Parallel(n_jobs=n_jobs, backend="loky")(
+        delayed(_match_chunk)(
+            queries[k:k + chunk_size], query_token_ids[k:k + chunk_size],
+            index, score_cutoff, refine_scorer, top_k
         )
-
-        if best is None:
-            results.append((None, None))
-            continue
-
-        candidate_norm, score, _ = best
-
-        if not is_plausible_match(q, candidate_norm):
-            results.append((None, None))
-            continue
-
-        results.append((candidate_norm, float(score)))
-
-    left["match_norm"] = [r[0] for r in results]
-    left["match_score"] = [r[1] for r in results]
-
-    # récupérer la valeur originale côté droite (pas normalisée)
-    # on prend la première occurrence
-    norm_to_original = (
-        right.dropna(subset=["_norm"])
-             .drop_duplicates("_norm")
-             .set_index("_norm")[right_col]
-             .to_dict()
+        for k in bounds
     )
-    left["match_name"] = left["match_norm"].map(norm_to_original)
+    match_idx = np.concatenate([np.empty(0, dtype=np.int64)] + [idx for idx, _ in chunk_results])
+    match_score = np.concatenate([np.empty(0, dtype=np.float32)] + [score for _, score in chunk_results])
 
-    # nettoyage colonnes temporaires
-    left.drop(columns=["_norm"], inplace=True, errors="ignore")
+    # indice du choix retenu -> nom normalisé et valeur originale côté droite
+    # (première occurrence) par simple indexation positionnelle ; None si pas de match
+    has_match = match_idx >= 0
+    match_norm = np.empty(len(match_idx), dtype=object)
+    match_norm[has_match] = np.asarray(choices, dtype=object)[match_idx[has_match]]
+    match_name = np.empty(len(match_idx), dtype=object)
+    match_name[has_match] = df_right[right_col].to_numpy(dtype=object)[choice_rows[match_idx[has_match]]]
 
-    return left
+    return df_left.assign(
+        match_norm=match_norm,
+        match_score=match_score,
+        match_name=match_name
+    )
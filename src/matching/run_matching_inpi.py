@@ -1,10 +1,19 @@
 import argparse
 import os
 import pandas as pd
+from rapidfuzz import fuzz
 
 from src.matching.name_matching import match_companies
 
 
+def positive_int(value: str) -> int:
+    """Type argparse : entier >= 1."""
+    n = int(value)
+    if n < 1:
+        raise argparse.ArgumentTypeError(f"doit être >= 1 (reçu {value})")
+    return n
+
+
 def main():
     parser = argparse.ArgumentParser(description="Matching startups FrenchCleantech avec entreprises INPI (fichier local)")
     parser.add_argument("--startups", required=True, help="CSV startups (companies)")
@@ -12,11 +21,17 @@ def main():
     parser.add_argument("--startup-col", default="startup_name", help="Colonne nom startup")
     parser.add_argument("--inpi-col", default="company_name", help="Colonne nom entreprise INPI")
     parser.add_argument("--score-cutoff", type=int, default=90, help="Seuil minimal de matching (0-100)")
+    parser.add_argument("--refine-scorer", choices=["WRatio", "QRatio", "ratio", "token_sort_ratio"], default=None,
+                        help="Scorer RapidFuzz pour départager les meilleurs candidats (optionnel)")
+    parser.add_argument("--top-k", type=positive_int, default=10, help="Candidats départagés par --refine-scorer")
+    parser.add_argument("--n-jobs", type=int, default=-1, help="Processus pour le matching (-1 = tous les cœurs)")
     parser.add_argument("--out", required=True, help="CSV sortie matching")
     args = parser.parse_args()
 
-    df_startups = pd.read_csv(args.startups)
-    df_inpi = pd.read_csv(args.inpi)
+    # lecteur CSV pyarrow (multi-thread) et colonnes texte en buffers Arrow ;
+    # côté INPI seule la colonne de noms est utile au matching
+    df_startups = pd.read_csv(args.startups, engine="pyarrow", dtype_backend="pyarrow")
+    df_inpi = pd.read_csv(args.inpi, engine="pyarrow", dtype_backend="pyarrow", usecols=[args.inpi_col])
 
     # matching
     df_matched = match_companies(
@@ -24,7 +39,10 @@ def main():
         left_col=args.startup_col,
         df_right=df_inpi,
         right_col=args.inpi_col,
-        score_cutoff=args.score_cutoff
+        score_cutoff=args.score_cutoff,
+        n_jobs=args.n_jobs,
+        refine_scorer=getattr(fuzz, args.refine_scorer) if args.refine_scorer else None,
+        top_k=args.top_k
     )
 
     os.makedirs(os.path.dirname(args.out), exist_ok=True)
@@ -1,15 +1,21 @@
 import argparse
 import os
 import re
+import threading
 import time
 import unicodedata
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
+from functools import lru_cache
 from typing import Dict, List, Optional
 from urllib.parse import urljoin
 
+import lxml.html
 import pandas as pd
 import requests
-from bs4 import BeautifulSoup
+import requests_cache
+from lxml import etree
+from lxml.html import HtmlElement
 
 
 DEFAULT_HEADERS = {
@@ -27,22 +33,47 @@ LEGAL_FORMS = {
     "BV", "GMBH", "SPA", "SRL"
 }
 
+_LEGAL_RE = re.compile(r"\b(" + "|".join(sorted(LEGAL_FORMS)) + r")\b")
+_RE_NONALNUM = re.compile(r"[^A-Z0-9]+")
+_RE_WS = re.compile(r"\s+")
+_RE_COMBINING = re.compile("[\u0300-\u036f]")
+# token d'1 caractère suivi d'un token de 4 caractères max, sur un nom déjà normalisé
+_MERGE_RE = re.compile(r"\b([A-Z0-9])\s+([A-Z0-9]{1,4})\b")
+
+# liens 'Read more' (insensible à la casse) et, pour chacun, l'ancêtre le plus proche
+# (10 niveaux max) dont le premier titre h1/h2/h3 n'est pas vide
+_READ_MORE_XPATH = etree.XPath("//a[contains(translate(., 'READMO', 'readmo'), 'read more')]")
+_CARD_BLOCK_XPATH = etree.XPath(
+    "ancestor::*[position() <= 10]"
+    "[(.//h1 | .//h2 | .//h3)[1][normalize-space(translate(., '\u00a0', ' '))]][1]"
+)
+
+# table octet -> octet : A-Z et 0-9 conservés, tout le reste devient un espace
+_ALNUM = b"ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+_XLATE = bytes(c if c in _ALNUM else 0x20 for c in range(256))
+
 
 def clean_text(x: Optional[str]) -> str:
     if not x:
         return ""
-    return re.sub(r"\s+", " ", str(x)).strip()
+    return _RE_WS.sub(" ", str(x)).strip()
 
 
 def normalize_company_name(name: str) -> str:
     """Normalisation simple : majuscules, suppression accents, suppression formes juridiques."""
     if not isinstance(name, str):
         return ""
+    return _normalize_company_name(name)
+
+
+@lru_cache(maxsize=1_000_000)
+def _normalize_company_name(name: str) -> str:
     x = name.upper()
-    x = unicodedata.normalize("NFKD", x)
-    x = "".join(c for c in x if not unicodedata.combining(c))
-    x = re.sub(r"[^A-Z0-9]", " ", x)
-    x = re.sub(r"\s+", " ", x).strip()
+    if not x.isascii():
+        # accents -> caractères combinants supprimés ; le reste du non-ASCII (’, –, Œ...)
+        # devient '?' puis un séparateur via _XLATE
+        x = _RE_COMBINING.sub("", unicodedata.normalize("NFKD", x))
+    x = x.encode("ascii", "replace").translate(_XLATE).decode("ascii")
     tokens = [t for t in x.split() if t not in LEGAL_FORMS]
     return " ".join(tokens)
 
@@ -51,25 +82,47 @@ def normalize_company_name_v2(name: str) -> str:
     """Normalisation améliorée : fusionne tokens d'1 lettre (ex: 'S TILE' -> 'STILE')."""
     if not isinstance(name, str):
         return ""
-    x = name.upper()
-    x = unicodedata.normalize("NFKD", x)
-    x = "".join(c for c in x if not unicodedata.combining(c))
-    x = re.sub(r"[^A-Z0-9]", " ", x)
-    x = re.sub(r"\s+", " ", x).strip()
+    return _normalize_company_name_v2(name)
 
-    tokens = [t for t in x.split() if t not in LEGAL_FORMS]
 
-    merged: List[str] = []
-    i = 0
-    while i < len(tokens):
-        if i + 1 < len(tokens) and len(tokens[i]) == 1 and len(tokens[i + 1]) <= 4:
-            merged.append(tokens[i] + tokens[i + 1])
-            i += 2
-        else:
-            merged.append(tokens[i])
-            i += 1
+@lru_cache(maxsize=1_000_000)
+def _normalize_company_name_v2(name: str) -> str:
+    return _merge_single_letter_tokens(_normalize_company_name(name))
+
+
+def _merge_single_letter_tokens(x: str) -> str:
+    """Fusionne un token d'1 lettre avec le suivant s'il fait au plus 4 caractères."""
+    return _MERGE_RE.sub(r"\1\2", x)
+
+
+def normalize_series(s: pd.Series) -> pd.Series:
+    """Équivalent vectorisé de normalize_company_name, appliqué à toute une colonne."""
+    s = s.astype(object)
+    # valeurs non textuelles (nombres, NA) -> NA, rendues "" par le fillna final
+    s = s.where(s.map(lambda v: isinstance(v, str)))
+    return (
+        s.str.upper()
+         .str.normalize("NFKD")
+         .str.replace(_RE_COMBINING, "", regex=True)
+         .str.replace(_RE_NONALNUM, " ", regex=True)
+         .str.replace(_LEGAL_RE, "", regex=True)
+         .str.replace(_RE_WS, " ", regex=True)
+         .str.strip()
+         .fillna("")
+    )
+
+
+def _first_heading(block: HtmlElement) -> Optional[HtmlElement]:
+    """Premier titre h1/h2/h3 sous le bloc (ordre du document)."""
+    return next(block.iterdescendants("h1", "h2", "h3"), None)
 
-    return " ".join(merged)
+
+def _next_element(node: HtmlElement) -> Optional[HtmlElement]:
+    """Frère suivant de type balise (ignore commentaires et instructions)."""
+    sib = node.getnext()
+    while sib is not None and not isinstance(sib.tag, str):
+        sib = sib.getnext()
+    return sib
 
 
 @dataclass
@@ -81,44 +134,94 @@ class CompanyRow:
     list_page: int
 
 
+class RateLimiter:
+    """Espace les requêtes d'au moins interval_s secondes, tous threads confondus."""
+
+    def __init__(self, interval_s: float):
+        self.interval_s = interval_s
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval_s
+        if slot > now:
+            time.sleep(slot - now)
+
+
 class FrenchCleantechScraper:
     def __init__(
         self,
         base_url: str = BASE_URL,
         headers: Optional[Dict[str, str]] = None,
         timeout: int = 30,
-        sleep_s: float = 0.6
+        sleep_s: float = 0.6,
+        max_workers: int = 4,
+        cache_name: Optional[str] = ".fcleantech_cache",
+        cache_expire_s: int = 24 * 3600
     ):
         self.base_url = base_url
         self.headers = headers or DEFAULT_HEADERS
         self.timeout = timeout
         self.sleep_s = sleep_s
-        self.session = requests.Session()
+        self.max_workers = max_workers
+        self.rate_limiter = RateLimiter(sleep_s)
+        if cache_name:
+            # cache HTTP local (sqlite) : une page déjà vue ne repasse pas par le réseau
+            self.session = requests_cache.CachedSession(
+                cache_name,
+                backend="sqlite",
+                expire_after=cache_expire_s
+            )
+            self.session.cache.delete(expired=True)
+        else:
+            self.session = requests.Session()
         self.session.headers.update(self.headers)
 
-    def get_soup(self, url: str) -> BeautifulSoup:
+    def is_cached(self, url: str) -> bool:
+        cache = getattr(self.session, "cache", None)
+        return cache is not None and cache.contains(url=url)
+
+    def get_soup(self, url: str) -> Optional[HtmlElement]:
+        """
+        Télécharge et parse une page ; None si elle ne contient aucun 'read more'.
+        Si tous les 'read more' sont dans <main>...</main>, seul ce fragment est parsé.
+        """
+        # pas d'attente pour une page servie par le cache
+        if not self.is_cached(url):
+            self.rate_limiter.wait()
         r = self.session.get(url, timeout=self.timeout)
         r.raise_for_status()
-        return BeautifulSoup(r.text, "html.parser")
+
+        # pré-filtre sur les octets bruts, bien moins coûteux qu'un parsing HTML
+        content = r.content
+        lc = content.lower()
+        first = lc.find(b"read more")
+        if first == -1:
+            return None
+        start = lc.find(b"<main")
+        end = lc.rfind(b"</main>")
+        if -1 < start < first and lc.rfind(b"read more") < end:
+            content = content[start:end + len(b"</main>")]
+
+        # parsing des octets avec l'encodage de la réponse : lxml refuse une str qui commence
+        # par une déclaration <?xml ... encoding=...?> (pages XHTML)
+        parser = lxml.html.HTMLParser(encoding=r.encoding or r.apparent_encoding)
+        return lxml.html.document_fromstring(content, parser=parser)
 
     @staticmethod
-    def extract_cards(soup: BeautifulSoup):
+    def extract_cards(soup: HtmlElement):
         """
         Repère les liens 'Read more' puis remonte au bloc contenant un titre (h1/h2/h3).
         Retourne une liste de tuples: (block_html, readmore_link)
         """
-        read_more = soup.find_all("a", string=re.compile(r"read more", re.I))
         cards = []
-        for a in read_more:
-            block = a
-            for _ in range(10):
-                block = getattr(block, "parent", None)
-                if block is None:
-                    break
-                title = block.find(["h1", "h2", "h3"])
-                if title and clean_text(title.get_text()):
-                    cards.append((block, a))
-                    break
+        for a in _READ_MORE_XPATH(soup):
+            block = _CARD_BLOCK_XPATH(a)
+            if block:
+                cards.append((block[0], a))
         return cards
 
     @staticmethod
@@ -127,36 +230,42 @@ class FrenchCleantechScraper:
         Essaie de récupérer la tagline (texte sous le nom).
         On se limite à quelques siblings pour éviter de prendre 'Read more'.
         """
-        if not name_tag:
+        if name_tag is None:
             return ""
-        sib = name_tag.find_next_sibling()
+        sib = _next_element(name_tag)
         for _ in range(4):
             if sib is None:
                 break
-            t = clean_text(sib.get_text(" ", strip=True))
+            t = clean_text(" ".join(sib.xpath(".//text()")))
             if t and "read more" not in t.lower():
                 return t
-            sib = sib.find_next_sibling()
+            sib = _next_element(sib)
         return ""
 
     def scrape_category(self, category_slug: str, category_name: str, max_page: int) -> pd.DataFrame:
         rows: List[CompanyRow] = []
 
-        for page in range(1, max_page + 1):
-            url = (
-                f"{self.base_url}companies/categories/{category_slug}.html"
-                if page == 1
-                else f"{self.base_url}companies/categories/{category_slug}.html?page={page}"
-            )
+        urls = [
+            f"{self.base_url}companies/categories/{category_slug}.html"
+            if page == 1
+            else f"{self.base_url}companies/categories/{category_slug}.html?page={page}"
+            for page in range(1, max_page + 1)
+        ]
+
+        # téléchargements en parallèle (le rate limiter garde sleep_s entre deux requêtes),
+        # pages traitées ensuite dans l'ordre
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            soups = list(executor.map(self.get_soup, urls))
+
+        for page, (url, soup) in enumerate(zip(urls, soups), start=1):
             print(f"[FrenchCleantech] Page {page:02d}/{max_page} -> {url}")
 
-            soup = self.get_soup(url)
-            cards = self.extract_cards(soup)
+            cards = self.extract_cards(soup) if soup is not None else []
             print(f"  - Cartes trouvées: {len(cards)}")
 
             for block, readmore_a in cards:
-                name_tag = block.find(["h1", "h2", "h3"])
-                startup_name = clean_text(name_tag.get_text()) if name_tag else ""
+                name_tag = _first_heading(block)
+                startup_name = clean_text(name_tag.text_content()) if name_tag is not None else ""
                 tagline = self.extract_tagline_from_block(block, name_tag)
 
                 detail_url = urljoin(self.base_url, readmore_a.get("href", ""))
@@ -169,14 +278,15 @@ class FrenchCleantechScraper:
                     list_page=page
                 ))
 
-            time.sleep(self.sleep_s)
-
         df = pd.DataFrame([r.__dict__ for r in rows])
         df = df.drop_duplicates(subset=["startup_name", "detail_url"]).reset_index(drop=True)
 
-        # Nettoyage noms
-        df["name_clean"] = df["startup_name"].apply(normalize_company_name)
-        df["name_clean_v2"] = df["startup_name"].apply(normalize_company_name_v2)
+        # Nettoyage noms : normalisation des seuls noms distincts, reportée ensuite sur les lignes
+        codes, uniques = pd.factorize(df["startup_name"], use_na_sentinel=False)
+        name_clean = normalize_series(pd.Series(uniques))
+        name_clean_v2 = name_clean.str.replace(_MERGE_RE, r"\1\2", regex=True)
+        df["name_clean"] = name_clean.to_numpy()[codes]
+        df["name_clean_v2"] = name_clean_v2.to_numpy()[codes]
 
         return df
 
@@ -200,12 +310,13 @@ def main():
     parser.add_argument("--max-page", type=int, required=True, help="Nombre de pages à scraper (ex: 19)")
     parser.add_argument("--out-raw", required=True, help="Chemin de sortie CSV raw")
     parser.add_argument("--out-companies", required=True, help="Chemin de sortie CSV entreprises uniques")
+    parser.add_argument("--no-cache", action="store_true", help="Désactive le cache HTTP local")
     args = parser.parse_args()
 
     os.makedirs(os.path.dirname(args.out_raw), exist_ok=True)
     os.makedirs(os.path.dirname(args.out_companies), exist_ok=True)
 
-    scraper = FrenchCleantechScraper()
+    scraper = FrenchCleantechScraper(cache_name=None) if args.no_cache else FrenchCleantechScraper()
     df = scraper.scrape_category(
         category_slug=args.category_slug,
         category_name=args.category_name,